@@ -1,20 +1,357 @@
 """ Conductance functions"""
 
+import functools
+import importlib
+
 import numpy as np
 import pandas as pd
 import os
 import apexpy
-from scipy.interpolate import interp1d
 from lompe.utils import sunlight
 from dipole import Dipole
 from scipy.interpolate import RectBivariateSpline
 
+try:  # numba is optional - if available, the Hardy model evaluation is jit-compiled
+    from numba import njit, prange
+except ImportError:
+    njit = prange = None
+
 
 d2r = np.pi/180
 
+basepath = os.path.dirname(__file__)
+
+# sza grid and maximum plasma production for the Chapman EUV conductance
+# (static tables - load and derive the calibration curves once at import)
+_MODELSZAS = np.arange(0, 120.1, 0.1)  # DO NOT CHANGE
+_MODELSZA_STEP = 0.1
+_PRODUCTION = np.loadtxt(os.path.join(
+    basepath, '../data/chapman_euv_productionvalues.txt'))
+_SQRT_PRODUCTION = np.sqrt(_PRODUCTION)
+
+# sza-dependent base curves (to be scaled by F107**exponent) and F10.7
+# exponents for each calibration supported by EUV_conductance. The scale
+# factors (e.g. 1.27/1.35 for MoenBrekke1993_alt) are obtained by setting
+# f107 = 1, sza = 0 deg in the empirical Pedersen/Hall conductance formulas
+# of the respective papers (see EUV_conductance docstring for references)
+_EUV_CALIBRATIONS = {
+    'MoenBrekke1993':     {'hall': 0.81*_PRODUCTION + 0.54*_SQRT_PRODUCTION,
+                           'pedersen': 0.34*_PRODUCTION + 0.93*_SQRT_PRODUCTION,
+                           'f107hallexponent': 0.53,
+                           'f107pedexponent': 0.49},
+    'MoenBrekke1993_alt': {'hall': 1.35*_PRODUCTION**0.79,
+                           'pedersen': 1.27*_PRODUCTION**0.65,
+                           'f107hallexponent': 0.53,
+                           'f107pedexponent': 0.49},
+    'Cousinsetal2015':    {'hall': 1.8*_PRODUCTION**1.,
+                           'pedersen': 0.5*_PRODUCTION**0.667,
+                           'f107hallexponent': 0.5,
+                           'f107pedexponent': 0.667}}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_backend(backend):
+    """ return the array module for the given backend name. 'numpy' is the
+    default; 'cupy' and 'jax' allow running the conductance models on GPU
+    (the corresponding package must be installed) """
+    modules = {'numpy': 'numpy', 'cupy': 'cupy', 'jax': 'jax.numpy'}
+    assert backend in modules, \
+        "backend must be one of %s" % list(modules)
+    return importlib.import_module(modules[backend])
+
+
+@functools.lru_cache(maxsize=None)
+def _backend_modelszas(xp):
+    """ the _MODELSZAS grid as a backend array (cached, so the grid is only
+    moved to the device once) """
+    return xp.asarray(_MODELSZAS)
+
+
+@functools.lru_cache(maxsize=None)
+def _backend_hardy_coefficients(hall_or_ped, kp, xp):
+    """ like _hardy_coefficients, but with the arrays moved to the given
+    backend (cached, one device transfer per table) """
+    n, is_sin, coeffs = _hardy_coefficients(hall_or_ped, kp)
+    return xp.asarray(n), xp.asarray(is_sin), xp.asarray(coeffs)
+
+
+@functools.lru_cache(maxsize=16)
+def _get_dipole(year):
+    """ return a Dipole object for the given year (cached, so the IGRF
+    dipole coefficients are only computed once per year) """
+    return Dipole(year)
+
+
+@functools.lru_cache(maxsize=16)
+def _dipole_rotation_matrix(year):
+    """ 3x3 geographic -> centered dipole rotation matrix for the given
+    year, recovered from the Dipole object by converting the three
+    geographic basis directions. Returns None if the probe fails, in
+    which case callers fall back to the Dipole methods """
+    try:
+        mlat, mlon = _get_dipole(year).geo2mag(np.array([0., 0., 90.]),
+                                               np.array([0., 90., 0.]))
+    except Exception:
+        return None
+    mlat, mlon = np.asarray(mlat) * d2r, np.asarray(mlon) * d2r
+    # columns are the dipole-frame cartesian images of the geo basis vectors
+    return np.array([np.cos(mlat) * np.cos(mlon),
+                     np.cos(mlat) * np.sin(mlon),
+                     np.sin(mlat)])
+
+
+def _mag2geo(mlat, mlon, year):
+    """ convert centered dipole latitude and longitude (degrees) to
+    geographic - equivalent to Dipole(year).mag2geo, but applies a cached
+    rotation matrix so the spherical/cartesian round trip is the only
+    per-call work """
+    R = _dipole_rotation_matrix(year)
+    if R is None:
+        return _get_dipole(year).mag2geo(mlat, mlon)
+    mlat, mlon = np.asarray(mlat) * d2r, np.asarray(mlon) * d2r
+    x, y, z = R.T @ np.array([np.cos(mlat) * np.cos(mlon),
+                              np.cos(mlat) * np.sin(mlon),
+                              np.sin(mlat)])
+    return np.arcsin(np.clip(z, -1, 1)) / d2r, np.arctan2(y, x) / d2r
+
+
+@functools.lru_cache(maxsize=None)
+def _load_hardy_table(hall_or_ped):
+    """ read and parse a full Hardy coefficient file ('hall' or 'pedersen').
+    Cached so the file I/O and parse only happen once per file
+
+    Returns a dict mapping integer Kp to (n, is_sin, coeffs), where n is
+    the harmonic number and is_sin the trig function implied by the 'term'
+    column (the const term counts as cos with n = 0), and coeffs is a
+    (T, 4) array with the columns maxvalue, maxlatitude, up-slope, down-slope
+    """
+    # the files are small comma-separated tables with a title and a header
+    # line (columns Kp, term, maxvalue, maxlatitude, up-slope, down-slope) -
+    # parse them directly rather than going through pandas
+    fn = os.path.join(basepath, '../data/hardy_%s_coefficients.txt' % hall_or_ped)
+    with open(fn) as f:
+        lines = f.read().splitlines()[2:]   # skip title and header
+
+    rows = np.array([[field.strip() for field in line.split(',')]
+                     for line in lines if line.strip()])
+
+    # parse all columns at once with vectorized string ops: the term names
+    # are 'Constant', 'SinK' or 'CosK', so stripping the letters leaves the
+    # harmonic number (or nothing for the constant term)
+    kps = rows[:, 0]
+    terms = rows[:, 1]
+    is_sin_all = np.char.startswith(terms, 'Sin')
+    harmonic = np.char.lstrip(terms, 'CosSinat')
+    n_all = np.where(harmonic == '', '0', harmonic).astype(int)
+    coeffs_all = rows[:, 2:].astype(np.float64)
+
+    table = {}
+    for kp in range(7):
+        mask = kps == 'K' + str(kp)
+        table[kp] = (n_all[mask], is_sin_all[mask], coeffs_all[mask])
+
+    return table
+
+
+def _hardy_coefficients(hall_or_ped, kp):
+    """ return (n, is_sin, coeffs) for the given Hardy coefficient table
+    ('hall' or 'pedersen') and integer Kp - see _load_hardy_table """
+    return _load_hardy_table(hall_or_ped)[kp]
+
+
+def _to_flat(a, b):
+    """ coerce two broadcastable inputs to flat arrays (at least 1D) and
+    return them together with their common shape. Unlike np.array(...,
+    ndmin=1) + flatten(), no copy is made when the inputs are already
+    ndarrays of matching shape (the common case: two grids) """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.ndim == 0:
+        a = a.reshape(1)
+    if b.ndim == 0:
+        b = b.reshape(1)
+    if a.shape == b.shape:
+        return a.ravel(), b.ravel(), a.shape
+
+    shape = np.broadcast_shapes(a.shape, b.shape)
+    a = np.ascontiguousarray(np.broadcast_to(a, shape)).ravel()
+    b = np.ascontiguousarray(np.broadcast_to(b, shape)).ravel()
+    return a, b, shape
+
+
+def _fourier_basis(mlt, max_n, xp=np):
+    """ sin(k*theta) and cos(k*theta) for theta = mlt*pi/12 and k = 0..max_n,
+    as two (max_n + 1, N) arrays """
+    theta = mlt * (np.pi / 12)
+    # build the higher harmonics by the Chebyshev recurrence
+    # f(k*theta) = 2*cos(theta)*f((k-1)*theta) - f((k-2)*theta), so that
+    # only two transcendental evaluations are needed no matter max_n
+    s1, c1 = xp.sin(theta), xp.cos(theta)
+    sins = [xp.zeros_like(theta), s1]
+    coss = [xp.ones_like(theta), c1]
+    two_c1 = 2 * c1
+    for k in range(2, max_n + 1):
+        sins.append(two_c1 * sins[-1] - sins[-2])
+        coss.append(two_c1 * coss[-1] - coss[-2])
+    return xp.stack(sins[:max_n + 1]), xp.stack(coss[:max_n + 1])
+
+
+def _hardy_conductance(mlat, mlt, tables, dtype=None, xp=np):
+    """ evaluate the Hardy conductance model at mlat, mlt (flat arrays) for
+    one or more parsed coefficient tables (from _hardy_coefficients),
+    optionally in reduced precision and/or on a non-numpy backend.
+    Returns a list of conductance arrays, one per table """
+
+    if dtype is not None:
+        tables = [(n, is_sin, coeffs.astype(dtype))
+                  for n, is_sin, coeffs in tables]
+
+    if xp is np and njit is not None:
+        mlat = np.ascontiguousarray(mlat, dtype=dtype or np.float64)
+        mlt = np.ascontiguousarray(mlt, dtype=dtype or np.float64)
+        # concatenate the term arrays so that all tables are evaluated in a
+        # single pass over the points, sharing the mlt angle per point
+        n_all = np.concatenate([n for n, _, _ in tables])
+        is_sin_all = np.concatenate([is_sin for _, is_sin, _ in tables])
+        coeffs_all = np.ascontiguousarray(
+            np.concatenate([coeffs for _, _, coeffs in tables]))
+        starts = np.cumsum([0] + [n.size for n, _, _ in tables]).astype(np.int64)
+        out = np.empty((len(tables), mlat.size), dtype=mlat.dtype)
+        _hardy_kernel(mlat, mlt, n_all, is_sin_all, coeffs_all, starts, out)
+        return list(out)
+
+    # trig basis, shared between the tables (Hall and Pedersen use the
+    # same harmonics of the same mlt)
+    SIN, COS = _fourier_basis(mlt, max(int(n.max()) for n, _, _ in tables), xp)
+
+    out = []
+    for n, is_sin, coeffs in tables:
+        # evaluate the fourier series for the four Epstein parameters in one
+        # matmul: (4, T) coefficients times the (T, N) trig basis
+        basis = xp.where(is_sin[:, None], SIN[n], COS[n])
+        r, h0, S1, S2 = coeffs.T @ basis
+
+        # evaluate the Epstein transition function,
+        #     r + S1*d + (S2 - S1)*(log1p(-S1*e^d/S2) - log1p(-S1/S2)),
+        # where d = mlat - h0. The log term is split with log1p, which is
+        # more accurate near zero and valid here since S1 > 0 and S2 < 0
+        # throughout the model domain.
+        if xp is np:
+            # the parameter rows and two scratch buffers are reused in place
+            # so only the floor masks below allocate additional full-size
+            # arrays:
+            d = np.subtract(mlat, h0, out=h0)    # h0 is free after this
+            ratio = S1 / S2
+            tmp = np.exp(d)
+            np.multiply(tmp, ratio, out=tmp)
+            np.negative(tmp, out=tmp)
+            np.log1p(tmp, out=tmp)               # log1p(-S1*e^d/S2)
+            np.negative(ratio, out=ratio)
+            np.log1p(ratio, out=ratio)           # log1p(-S1/S2)
+            np.subtract(tmp, ratio, out=tmp)
+            np.subtract(S2, S1, out=S2)
+            np.multiply(tmp, S2, out=tmp)        # (S2 - S1)*log-term
+            np.multiply(S1, d, out=S1)
+            conductance = np.add(r, S1, out=r)
+            conductance += tmp
+
+            # introduce floors (using recommendation from paper);
+            # d < 0 / d > 0 is mlat below/above the peak latitude h0
+            conductance[(d < 0) & (conductance < 0)] = 0
+            conductance[(d > 0) & (conductance < 0.55)] = 0.55
+        else:
+            # expression form - device backends like jax do not support
+            # in-place ufuncs or masked assignment
+            d = mlat - h0
+            ratio = S1 / S2
+            conductance = r + S1 * d + (S2 - S1) * \
+                (xp.log1p(-ratio * xp.exp(d)) - xp.log1p(-ratio))
+            conductance = xp.where((d < 0) & (conductance < 0),
+                                   0., conductance)
+            conductance = xp.where((d > 0) & (conductance < 0.55),
+                                   0.55, conductance)
+
+        out.append(conductance)
+
+    return out
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _hardy_kernel(mlat, mlt, n, is_sin, coeffs, starts, out):
+        """ fused version of the pure-numpy path in _hardy_conductance:
+        Fourier sums, Epstein transition and floors in one parallel pass,
+        with no intermediate N-length arrays. Several coefficient tables
+        (concatenated, with table k in rows starts[k]:starts[k+1]) are
+        evaluated per point, so Hall and Pedersen share one pass. Results
+        go into out, which must be (K, N) with the same dtype as mlat """
+        N = mlat.size
+        K = starts.size - 1
+        for i in prange(N):
+            theta = mlt[i] * np.pi / 12
+            for k in range(K):
+                r, h0, S1, S2 = 0., 0., 0., 0.
+                for t in range(starts[k], starts[k + 1]):
+                    arg = n[t] * theta
+                    b = np.sin(arg) if is_sin[t] else np.cos(arg)
+                    r = r + coeffs[t, 0] * b
+                    h0 = h0 + coeffs[t, 1] * b
+                    S1 = S1 + coeffs[t, 2] * b
+                    S2 = S2 + coeffs[t, 3] * b
+
+                d = mlat[i] - h0
+                ratio = S1 / S2
+                c = r + S1 * d + (S2 - S1) * \
+                    (np.log1p(-ratio * np.exp(d)) - np.log1p(-ratio))
+
+                # floors (using recommendation from paper)
+                if d < 0 and c < 0:
+                    c = 0.
+                elif d > 0 and c < 0.55:
+                    c = 0.55
+                out[k, i] = c
+
+
+@functools.lru_cache(maxsize=32)
+def _get_euv_tables(F107, calibration, dtype=None, xp=np):
+    """ return the F10.7-scaled (hall, pedersen) EUV conductance tables on
+    the _MODELSZAS grid. Cached, so repeated calls with the same F107 and
+    calibration - the common case in a time-series inversion - skip the
+    scaling (and any device transfer) entirely """
+    cal = _EUV_CALIBRATIONS[calibration]
+    hall = F107**cal['f107hallexponent'] * cal['hall']
+    pedersen = F107**cal['f107pedexponent'] * cal['pedersen']
+    if dtype is not None:
+        hall = hall.astype(dtype)
+        pedersen = pedersen.astype(dtype)
+    if xp is not np:
+        hall, pedersen = xp.asarray(hall), xp.asarray(pedersen)
+    return hall, pedersen
+
+
+def _euv_interp_prepared(sza, xp=np):
+    """ return interpolation indices and weights for sza on the _MODELSZAS
+    grid, so that several tables can be interpolated with a single search.
+    Weights outside [0, 1] extrapolate linearly beyond the table ends
+    (like scipy's interp1d with fill_value='extrapolate') """
+    sza = xp.asarray(sza)
+    grid = _MODELSZAS if xp is np else _backend_modelszas(xp)
+    # the grid is uniform, so the segment index follows directly from sza -
+    # no need for a binary search (int32 is plenty for the 1201-point grid):
+    idx = xp.clip((sza / _MODELSZA_STEP).astype(np.int32), 0, grid.size - 2)
+    w = (sza - grid[idx]) / (grid[idx + 1] - grid[idx])
+    return idx, w
+
+
+def _euv_apply(idx, w, table, xp=np):
+    """ linearly interpolate table using indices and weights from
+    _euv_interp_prepared """
+    lo = table[idx]
+    return xp.asarray(lo + w * (table[idx + 1] - lo))
+
 
 def hardy_EUV(lon, lat, kp, time, hall_or_pedersen='hp', starlight=0, F107=100,
-              dipole=False, calibration='MoenBrekke1993'):
+              dipole=False, calibration='MoenBrekke1993', dtype=None,
+              backend='numpy'):
     """ calculate conductance at lat, lon for given kp at given time
     based on Hardy model + EUV contribution, from the functions defined below
 
@@ -41,6 +378,14 @@ def hardy_EUV(lon, lat, kp, time, hall_or_pedersen='hp', starlight=0, F107=100,
     calibration: string, optional
         calibration to use in EUV_conductance calculation. See documentation
         of EUV_conductance function for info
+    dtype: numpy dtype, optional
+        evaluate the model in this precision (e.g. np.float32, which halves
+        the memory traffic on large grids). Default is None (float64)
+    backend: string, optional
+        'numpy' (default), 'cupy', or 'jax'. With 'cupy' or 'jax' the
+        conductance models are evaluated on the GPU and device arrays are
+        returned. The coordinate conversions and solar zenith angles are
+        still computed on the CPU
 
     Returns
     -------
@@ -49,21 +394,19 @@ def hardy_EUV(lon, lat, kp, time, hall_or_pedersen='hp', starlight=0, F107=100,
     If hall_or_pedersen == 'pedersen':
         Total Pedersen conductances [mho] for each lat, lon
     If hall_or_pedersen == 'hallandpedersen' or 'hp':
-        Two arrays of conductances [mho] for each lat, lon, 
-        one for total Hall and one for total Pedersen 
+        Two arrays of conductances [mho] for each lat, lon,
+        one for total Hall and one for total Pedersen
 
     """
     assert hall_or_pedersen.lower() in ['hall', 'h', 'pedersen', 'p', 'hp',
                                         'hallandpedersen'], "hardy_EUV: hall_or_pedersen must be either hall or pedersen, or hallandpedersen"
 
-    lat, lon = np.array(lat, ndmin=1), np.array(lon, ndmin=1)
-    shape = np.broadcast(lat, lon).shape
-    lat, lon = lat.flatten(), lon.flatten()
+    lat, lon, shape = _to_flat(lat, lon)
 
-    cd = Dipole(time.year)
+    cd = _get_dipole(time.year)
     if dipole:
         mlat, mlon = lat, lon  # input lat, lon is centered dipole
-        lat, lon = cd.mag2geo(lat, lon)  # to geographic
+        lat, lon = _mag2geo(lat, lon, time.year)  # to geographic
     else:
         a = apexpy.Apex(time, 110)
         mlat, mlon = a.geo2apex(lat, lon, 110)  # to mag
@@ -79,26 +422,30 @@ def hardy_EUV(lon, lat, kp, time, hall_or_pedersen='hp', starlight=0, F107=100,
     if hall_or_pedersen.lower() in ['hp', 'hallandpedersen']:
         hop = 'hp'
 
+    xp = _get_backend(backend)
+
     if len(hop) > 1:
         EUVh, EUVp = EUV_conductance(
-            sza, F107, hop, calibration=calibration)  # EUV
+            sza, F107, hop, calibration=calibration,
+            dtype=dtype, backend=backend)  # EUV
         hc_hall, hc_pedersen = hardy(
-            mlat, mlt, kp, hop)                        # auroral
+            mlat, mlt, kp, hop, dtype=dtype, backend=backend)  # auroral
     else:
-        EUV = EUV_conductance(sza, F107, hop, calibration=calibration)  # EUV
+        EUV = EUV_conductance(sza, F107, hop, calibration=calibration,
+                              dtype=dtype, backend=backend)  # EUV
         # auroral
-        hc = hardy(mlat, mlt, kp, hop)
+        hc = hardy(mlat, mlt, kp, hop, dtype=dtype, backend=backend)
 
     if hop == 'h':
-        return (np.sqrt(hc**2 + EUV**2 + starlight**2)).reshape(shape)
+        return (xp.sqrt(hc**2 + EUV**2 + starlight**2)).reshape(shape)
     elif hop == 'p':
-        return (np.sqrt(hc**2 + EUV**2 + starlight**2)).reshape(shape)
+        return (xp.sqrt(hc**2 + EUV**2 + starlight**2)).reshape(shape)
     else:
-        return (np.sqrt(hc_hall**2 + EUVh**2 + starlight**2)).reshape(shape), (np.sqrt(hc_pedersen**2 + EUVp**2 + starlight**2)).reshape(shape)
+        return (xp.sqrt(hc_hall**2 + EUVh**2 + starlight**2)).reshape(shape), (xp.sqrt(hc_pedersen**2 + EUVp**2 + starlight**2)).reshape(shape)
 
 
 def EUV_conductance(sza, F107=100, hallOrPed='hp',
-                    calibration='MoenBrekke1993'):
+                    calibration='MoenBrekke1993', dtype=None, backend='numpy'):
     """
     cond = EUV_conductance(sza, F107, hallOrPed, calibration='MoenBrekke1993')
 
@@ -131,8 +478,14 @@ def EUV_conductance(sza, F107=100, hallOrPed='hp',
 
         For Cousins et al (2015), Hall and Pedersen conductance are modeled using their 
         Equations (13) and (14).
-        For Moen and Brekke (1993), Hall and Pedersen conductance are modeled using their 
+        For Moen and Brekke (1993), Hall and Pedersen conductance are modeled using their
         Equation (6).
+    dtype: numpy dtype, optional
+        evaluate in this precision (e.g. np.float32). Default is None (float64)
+    backend: string, optional
+        'numpy' (default), 'cupy', or 'jax'. With 'cupy' or 'jax' the table
+        lookup runs on the GPU and a device array is returned (the package
+        must be installed). Input is expected to be a host (numpy) array
 
     Returns
     -------
@@ -177,94 +530,52 @@ def EUV_conductance(sza, F107=100, hallOrPed='hp',
     assert hallOrPed.lower() in [
         'h', 'p', 'hp'], "EUV_conductance: Must select one of 'h', 'p', or 'hp' for hallOrPed!"
 
-    PRODUCTIONFILE = os.path.join(os.path.dirname(
-        __file__), '../data/chapman_euv_productionvalues.txt')
-
-    MODELSZAS = np.arange(0, 120.1, 0.1)  # DO NOT CHANGE
-    PRODUCTION = np.loadtxt(PRODUCTIONFILE)
+    xp = _get_backend(backend)
 
     getH = 'h' in hallOrPed.lower()
     getP = 'p' in hallOrPed.lower()
 
-    if calibration not in ['MoenBrekke1993', 'MoenBrekke1993_alt', 'Cousinsetal2015']:
+    if calibration not in _EUV_CALIBRATIONS:
         defcal = 'MoenBrekke1993'
         print(f"Invalid calibration: {calibration}. Using {defcal}")
         calibration = defcal
 
-    if calibration == 'MoenBrekke1993':
-        # PedScl = 1.27               # Obtained by setting f107 = 1, sza = 0° in Moen and Brekke's (1993) empirical Pedersen conductance formula
-        # HalScl = 1.35               # Obtained by setting f107 = 1, sza = 0° in Moen and Brekke's (1993) empirical Hall conductance formula
-
-        f107pedexponent = 0.49
-        f107hallexponent = 0.53
-
-    elif calibration == 'MoenBrekke1993_alt':
-        # Obtained by setting f107 = 1, sza = 0° in Moen and Brekke's (1993) empirical Pedersen conductance formula
-        PedScl = 1.27
-        # Obtained by setting f107 = 1, sza = 0° in Moen and Brekke's (1993) empirical Hall conductance formula
-        HalScl = 1.35
-
-        f107pedexponent = 0.49
-        f107hallexponent = 0.53
-        pedexponent = 0.65
-        hallexponent = 0.79
-
-    elif calibration == 'Cousinsetal2015':
-        # Obtained by setting f107 = 1, sza = 0° in Brekke and Moen's (1993) empirical Pedersen conductance formula
-        PedScl = 0.5
-        # Obtained by setting f107 = 1, sza = 0° in Brekke and Moen's (1993) empirical Hall conductance formula
-        HalScl = 1.8
-
-        f107pedexponent = 0.667
-        f107hallexponent = 0.5
-        pedexponent = 0.667
-        hallexponent = 1
-
-    if calibration == 'MoenBrekke1993':
-
-        if getH:
-            halinterp = interp1d(MODELSZAS,
-                                 F107**(f107hallexponent)*(0.81 *
-                                                           PRODUCTION + 0.54*np.sqrt(PRODUCTION)),
-                                 fill_value='extrapolate')
-            sigh = halinterp(sza)  # moh
-
-        if getP:
-            pedinterp = interp1d(MODELSZAS,
-                                 F107**(f107pedexponent)*(0.34 *
-                                                          PRODUCTION + 0.93*np.sqrt(PRODUCTION)),
-                                 fill_value='extrapolate')
-            sigp = pedinterp(sza)  # moh
-
-    else:
-
-        if getH:
-            halinterp = interp1d(MODELSZAS,
-                                 F107**(f107hallexponent)*HalScl *
-                                 (PRODUCTION)**(hallexponent),
-                                 fill_value='extrapolate')
-            sigh = halinterp(sza)  # moh
+    try:
+        # scaled tables are cached for scalar F107 (the usual case)
+        hall_table, ped_table = _get_euv_tables(float(F107), calibration, dtype, xp)
+    except TypeError:
+        # array-valued F107 - build the tables directly
+        hall_table, ped_table = _get_euv_tables.__wrapped__(F107, calibration, dtype, xp)
+
+    # search the sza grid once - the indices and weights are shared between
+    # the Hall and Pedersen table lookups
+    idx, w = _euv_interp_prepared(sza, xp)
+    if dtype is not None:
+        w = w.astype(dtype)
+
+    if getH:
+        sigh = _euv_apply(idx, w, hall_table, xp)  # moh
+        if xp is np:
+            sigh[sigh < 0] = 0
+        else:
+            sigh = xp.where(sigh < 0, 0., sigh)
 
-        if getP:
-            pedinterp = interp1d(MODELSZAS,
-                                 F107**(f107pedexponent)*PedScl *
-                                 (PRODUCTION)**(pedexponent),
-                                 fill_value='extrapolate')
-            sigp = pedinterp(sza)  # moh
+    if getP:
+        sigp = _euv_apply(idx, w, ped_table, xp)  # moh
+        if xp is np:
+            sigp[sigp < 0] = 0
+        else:
+            sigp = xp.where(sigp < 0, 0., sigp)
 
     if getH and getP:
-        sigh[sigh < 0] = 0
-        sigp[sigp < 0] = 0
         return sigh.reshape(shape), sigp.reshape(shape)
     elif getH:
-        sigh[sigh < 0] = 0
         return sigh.reshape(shape)
     elif getP:
-        sigp[sigp < 0] = 0
         return sigp.reshape(shape)
 
 
-def hardy(mlat, mlt, kp, hallOrPed='hp'):
+def hardy(mlat, mlt, kp, hallOrPed='hp', dtype=None, backend='numpy'):
     """ calculte Hardy conductivity at given mlat/mlt, for given Kp 
 
     The model is described and defined in:
@@ -284,6 +595,13 @@ def hardy(mlat, mlt, kp, hallOrPed='hp'):
     hallOrPed: str, optional
         Must be one of 'h', 'p', or 'hp', (corresponding to "Hall," "Pedersen," or both)
         default is both
+    dtype: numpy dtype, optional
+        evaluate the model in this precision (e.g. np.float32). Default is
+        None (float64)
+    backend: string, optional
+        'numpy' (default), 'cupy', or 'jax'. With 'cupy' or 'jax' the model
+        is evaluated on the GPU and a device array is returned (the package
+        must be installed). Inputs are expected to be host (numpy) arrays
 
     Returns
     -------
@@ -305,83 +623,26 @@ def hardy(mlat, mlt, kp, hallOrPed='hp'):
     assert kp in [0, 1, 2, 3, 4, 5,
                   6], "hardy: Kp must be an integer in the range 0-6"
 
-    mlat, mlt = np.array(np.abs(mlat), ndmin=1), np.array(mlt, ndmin=1)
-    shape = np.broadcast(mlat, mlt).shape
-    mlat, mlt = mlat.flatten(), mlt.flatten()
-
-    # load hall and pedersen coefficient files:
-    basepath = os.path.dirname(__file__)
+    mlat, mlt, shape = _to_flat(np.abs(mlat), mlt)
+    if dtype is not None:
+        mlat, mlt = mlat.astype(dtype, copy=False), mlt.astype(dtype, copy=False)
 
-    # Hardy for Hall
-    if 'h' in hallOrPed.lower():
-        hc = pd.read_table(basepath + '/../data/hardy_hall_coefficients.txt',
-                           sep=',', skipinitialspace=True, skiprows=[0,])
-        hc = hc[hc.Kp == 'K' + str(kp)]     # select only relevant kp
-
-        # define a dictionary whose keys are the 'term' column values, and values are the corresponding function of mlt
-        hc['n'] = list(
-            map(int, [t[-1] if t[-1] != 't' else 0 for t in hc['term']]))
-        hc['trig'] = [np.sin if t[:3] == 'Sin' else np.cos for t in hc['term']]
-
-        # evaluate the fourier series
-        hall_epstein = dict(
-            zip([u'maxvalue', u'maxlatitude', u'up-slope', u'down-slope'], [0]*4))
-        for row in hc.iterrows():
-            values = row[1]
-            for key in hall_epstein:
-                hall_epstein[key] += values[key] * \
-                    values['trig'](values['n'] * mlt / 12 * np.pi)
-
-        # evaluate the Epstein transition function, Hall:
-        r, S1, S2, h0 = hall_epstein['maxvalue'], hall_epstein[
-            'up-slope'], hall_epstein['down-slope'], hall_epstein['maxlatitude']
-        hall_conductance = r + S1 * \
-            (mlat - h0) + (S2 - S1) * \
-            np.log((1 - S1/(S2 * np.exp(-(mlat - h0)))) / (1 - (S1/S2)))
-
-        # introduce floors (using recommendation from paper)
-        hall_conductance[(mlat < h0) & (hall_conductance < 0)] = 0
-        hall_conductance[(mlat > h0) & (hall_conductance < 0.55)] = 0.55
-
-    # Hardy for Pedersen
-    if 'p' in hallOrPed.lower():
-        pc = pd.read_table(basepath + '/../data/hardy_pedersen_coefficients.txt',
-                           sep=',', skipinitialspace=True, skiprows=[0,])
-        pc = pc[pc.Kp == 'K' + str(kp)]     # select only relevant kp
-
-        # define a dictionary whose keys are the 'term' column values, and values are the corresponding function of mlt
-        pc['n'] = list(
-            map(int, [t[-1] if t[-1] != 't' else 0 for t in pc['term']]))
-        # the const term will be cos, but with n = 0
-        pc['trig'] = [np.sin if t[:3] == 'Sin' else np.cos for t in pc['term']]
-
-        # evaluate the fourier series
-        pedersen_epstein = dict(
-            zip([u'maxvalue', u'maxlatitude', u'up-slope', u'down-slope'], [0]*4))
-        for row in pc.iterrows():
-            values = row[1]
-            for key in pedersen_epstein:
-                pedersen_epstein[key] += values[key] * \
-                    values['trig'](values['n'] * mlt / 12 * np.pi)
-
-        # evaluate the Epstein transition function, Pedersen:
-        r, S1, S2, h0 = pedersen_epstein['maxvalue'], pedersen_epstein[
-            'up-slope'], pedersen_epstein['down-slope'], pedersen_epstein['maxlatitude']
-        pedersen_conductance = r + S1 * \
-            (mlat - h0) + (S2 - S1) * \
-            np.log((1 - S1/(S2 * np.exp(-(mlat - h0)))) / (1 - (S1/S2)))
-
-        # introduce floors (using recommendation from paper)
-        pedersen_conductance[(mlat < h0) & (pedersen_conductance < 0)] = 0
-        pedersen_conductance[(mlat > h0) & (
-            pedersen_conductance < 0.55)] = 0.55
+    # Hardy for Hall and/or Pedersen - both tables are evaluated in one
+    # call so they can share the trig basis:
+    xp = _get_backend(backend)
+    if xp is np:
+        tables = [_hardy_coefficients(t, kp) for t in ('hall', 'pedersen')
+                  if t[0] in hallOrPed.lower()]
+    else:
+        tables = [_backend_hardy_coefficients(t, kp, xp)
+                  for t in ('hall', 'pedersen') if t[0] in hallOrPed.lower()]
+        mlat, mlt = xp.asarray(mlat), xp.asarray(mlt)
+    conductances = _hardy_conductance(mlat, mlt, tables, dtype=dtype, xp=xp)
 
-    if hallOrPed.lower() == 'h':
-        return hall_conductance.reshape(shape)
-    elif hallOrPed.lower() == 'p':
-        return pedersen_conductance.reshape(shape)
+    if hallOrPed.lower() in ['h', 'p']:
+        return conductances[0].reshape(shape)
     else:
-        return hall_conductance.reshape(shape), pedersen_conductance.reshape(shape)
+        return conductances[0].reshape(shape), conductances[1].reshape(shape)
 
 
 def calculate_robinson_conductance(FAC):
@@ -484,9 +745,7 @@ def robinson(mlat, mlt, sigmaH, sigmaP):
     amp_sh = (24, 50)  # Shape of the AMPERE FAC data product
     assert sigmaP.shape == amp_sh, f"Shape of Pedersen conductance array is not (24,50). Got: {sigmaP.shape}"
     assert sigmaH.shape == amp_sh, f"Shape of Hall conductance array is not (24,50). Got: {sigmaH.shape}"
-    mlat, mlt = np.array(np.abs(mlat), ndmin=1), np.array(mlt, ndmin=1)
-    shape = np.broadcast(mlat, mlt).shape
-    mlat, mlt = mlat.flatten(), mlt.flatten()
+    mlat, mlt, shape = _to_flat(np.abs(mlat), mlt)
 
     # Arrays of the native AMPERE FAC product coordinates
     # amp_colat = np.tile(np.arange(1,amp_sh[1]+1),amp_sh[0]+1).reshape((amp_sh[0]+1,amp_sh[1]))
@@ -546,14 +805,12 @@ def robinson_EUV(lon, lat, sigmaH, sigmaP, time, starlight=0, F107=100,
 
     """
 
-    lat, lon = np.array(lat, ndmin=1), np.array(lon, ndmin=1)
-    shape = np.broadcast(lat, lon).shape
-    lat, lon = lat.flatten(), lon.flatten()
+    lat, lon, shape = _to_flat(lat, lon)
 
-    cd = Dipole(time.year)
+    cd = _get_dipole(time.year)
     if dipole:
         mlat, mlon = lat, lon  # input lat, lon is centered dipole
-        lat, lon = cd.mag2geo(lat, lon)  # to geographic
+        lat, lon = _mag2geo(lat, lon, time.year)  # to geographic
     else:
         a = apexpy.Apex(time, 110)
         mlat, mlon = a.geo2apex(lat, lon, 110)  # to mag
@@ -739,14 +996,12 @@ def ZhangPaxton_EUV(lon, lat, kp, time, hall_or_pedersen='hp', starlight=0, F107
     assert hall_or_pedersen.lower() in ['hall', 'h', 'pedersen', 'p', 'hp',
                                         'hallandpedersen'], "ZhangPaxton_EUV: hall_or_pedersen must be either hall or pedersen, or hallandpedersen"
 
-    lat, lon = np.array(lat, ndmin=1), np.array(lon, ndmin=1)
-    shape = np.broadcast(lat, lon).shape
-    lat, lon = lat.flatten(), lon.flatten()
+    lat, lon, shape = _to_flat(lat, lon)
 
-    cd = Dipole(time.year)
+    cd = _get_dipole(time.year)
     if dipole:
         mlat, mlon = lat, lon  # input lat, lon is centered dipole
-        lat, lon = cd.mag2geo(lat, lon)  # to geographic
+        lat, lon = _mag2geo(lat, lon, time.year)  # to geographic
     else:
         a = apexpy.Apex(time, 110)
         mlat, mlon = a.geo2apex(lat, lon, 110)  # to mag
@@ -4,7 +4,7 @@ import pandas as pd
 import os
 import numpy as np
 from lompe.utils.time import date_to_doy, is_leapyear
-from dipole import sph_to_car, car_to_sph, subsol
+from dipole import subsol
 
 d2r = np.pi / 180
 r2d = 180 / np.pi
@@ -48,9 +48,11 @@ def sza(glat, glon, datetimes, degrees = True):
     # compute subsolar point
     sslat, sslon = subsol(datetimes)
 
-    # compute and return the angle
-    ssr = sph_to_car(np.vstack((np.ones_like(sslat), 90. - sslat, sslon)), deg = True)
-    gcr = sph_to_car(np.vstack((np.ones_like(glat ), 90. - glat , glon )), deg = True)
+    # the angle is arccos of the dot product between the subsolar point and
+    # (glat, glon) unit vectors - evaluated directly in spherical coordinates
+    # (law of cosines) to avoid building the cartesian vectors:
+    glat_r, sslat_r = glat * d2r, np.asarray(sslat) * d2r
+    cos_sza = np.sin(glat_r) * np.sin(sslat_r) + \
+              np.cos(glat_r) * np.cos(sslat_r) * np.cos((glon - np.asarray(sslon)) * d2r)
 
-    # the angle is arccos of the dot product of these two vectors
-    return np.arccos(np.sum(ssr*gcr, axis = 0))*conv
\ No newline at end of file
+    return np.arccos(np.clip(cos_sza, -1, 1)) * conv
\ No newline at end of file